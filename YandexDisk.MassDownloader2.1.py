@@ -1,23 +1,677 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+import array
+import collections
+import contextlib
 import tkinter as tk
 from tkinter import ttk, scrolledtext, filedialog, messagebox
-import requests
 import os
-from urllib.parse import unquote, urlencode
-from pathvalidate import sanitize_filename
+from urllib.parse import unquote, urlencode, urlparse
 import threading
 import sys
-import time
 import re
 import html
-from bs4 import BeautifulSoup
+import json
+import shutil
+import struct
+import zlib
+
+# Тяжелые модули (requests, pathvalidate, tkinterdnd2) импортируются лениво:
+# окно появляется раньше, а сеть и Drag&Drop подключаются по мере надобности.
+# Так же лениво подключаются модули очереди, кэша и воркеров (sqlite3, subprocess и др.)
+DND_AVAILABLE = None  # None - еще не проверяли
+
+_IMPORT_FINISHED = time.perf_counter()
+
+
+def sanitize_filename(filename):
+    """Очищает имя файла (pathvalidate загружается при первом вызове)"""
+    from pathvalidate import sanitize_filename as _sanitize_filename
+    return _sanitize_filename(filename)
+
+
+def load_dnd(root):
+    """Подключает tkinterdnd2 к уже созданному окну, возвращает DND_FILES или None"""
+    global DND_AVAILABLE
+    try:
+        from tkinterdnd2 import DND_FILES, TkinterDnD
+        # Окно создано обычным tk.Tk, поэтому пакет tkdnd загружаем вручную
+        TkinterDnD._require(root)
+        DND_AVAILABLE = True
+        return DND_FILES
+    except (ImportError, RuntimeError, AttributeError, tk.TclError):
+        DND_AVAILABLE = False
+        return None
+
+def safe_member_path(target_dir, member_name):
+    """Строит безопасный путь внутри target_dir для элемента архива или папки"""
+    parts = []
+    for part in re.split(r'[\\/]+', member_name):
+        if part in ('', '.', '..'):
+            continue
+        part = sanitize_filename(part)
+        if part:
+            parts.append(part)
+    if not parts:
+        return None
+    
+    full_path = os.path.join(target_dir, *parts)
+    # Дополнительная проверка, что путь не выходит за пределы целевой папки
+    root = os.path.realpath(target_dir)
+    if os.path.commonpath([root, os.path.realpath(full_path)]) != root:
+        return None
+    return full_path
+
+
+class ZipStreamError(Exception):
+    """Ошибка потоковой распаковки ZIP"""
+
+
+class ZipStreamExtractor:
+    """Распаковывает ZIP по мере поступления данных, без сохранения архива на диск
+    
+    Архив читается последовательно по локальным заголовкам, поэтому в памяти
+    держится только небольшой буфер, а не весь файл.
+    """
+    LOCAL_HEADER = 0x04034b50
+    DATA_DESCRIPTOR = 0x08074b50
+    CENTRAL_HEADERS = (0x02014b50, 0x06054b50, 0x06064b50, 0x07064b50)
+    
+    def __init__(self, target_dir, out_chunk_size=1024 * 1024):
+        self.target_dir = target_dir
+        self.out_chunk_size = out_chunk_size
+        self.buffer = b''
+        self.files_extracted = 0
+        self.bytes_extracted = 0
+        self.finished = False
+        self.entry = None
+        self.out_file = None
+        
+    def feed(self, data):
+        """Принимает очередную порцию байт архива"""
+        if self.finished:
+            return
+        self.buffer += data
+        while self.buffer and not self.finished:
+            if self.entry is None:
+                if not self._read_local_header():
+                    return
+            elif not self._read_entry_data():
+                return
+                
+    def close(self):
+        """Завершает распаковку, проверяя что архив не оборван"""
+        if self.entry is not None or (not self.finished and self.buffer):
+            self.abort()
+            raise ZipStreamError("Архив оборван")
+        if not self.finished and not self.files_extracted:
+            raise ZipStreamError("Пустой или некорректный архив")
+            
+    def abort(self):
+        """Закрывает и удаляет недописанный файл"""
+        if self.out_file:
+            path = self.out_file.name
+            self.out_file.close()
+            self.out_file = None
+            if os.path.exists(path):
+                os.remove(path)
+        self.entry = None
+        
+    def _read_local_header(self):
+        if len(self.buffer) < 4:
+            return False
+        signature = struct.unpack('<I', self.buffer[:4])[0]
+        if signature in self.CENTRAL_HEADERS:
+            # Дальше идет центральный каталог - все файлы уже распакованы
+            self.finished = True
+            self.buffer = b''
+            return False
+        if signature != self.LOCAL_HEADER:
+            raise ZipStreamError("Неизвестная сигнатура в архиве")
+        if len(self.buffer) < 30:
+            return False
+            
+        (_, _, flags, method, _, _, crc, comp_size, size,
+         name_len, extra_len) = struct.unpack('<IHHHHHIIIHH', self.buffer[:30])
+        header_len = 30 + name_len + extra_len
+        if len(self.buffer) < header_len:
+            return False
+            
+        raw_name = self.buffer[30:30 + name_len]
+        extra = self.buffer[30 + name_len:header_len]
+        self.buffer = self.buffer[header_len:]
+        
+        if flags & 0x1:
+            raise ZipStreamError("Зашифрованные архивы не поддерживаются")
+        if method not in (0, 8):
+            raise ZipStreamError(f"Неподдерживаемый метод сжатия: {method}")
+            
+        zip64 = False
+        if comp_size == 0xFFFFFFFF or size == 0xFFFFFFFF:
+            zip64 = True
+            comp_size, size = self._read_zip64_sizes(extra, comp_size, size)
+        elif self._has_zip64_extra(extra):
+            zip64 = True
+            
+        has_descriptor = bool(flags & 0x8)
+        if has_descriptor and method == 0:
+            raise ZipStreamError("Несжатые файлы без размера в заголовке не поддерживаются")
+            
+        if flags & 0x800:
+            name = raw_name.decode('utf-8', errors='replace')
+        else:
+            try:
+                name = raw_name.decode('utf-8')
+            except UnicodeDecodeError:
+                name = raw_name.decode('cp437')
+                
+        self.entry = {
+            'name': name,
+            'method': method,
+            'crc': crc,
+            'remaining': None if has_descriptor else comp_size,
+            'descriptor': has_descriptor,
+            'zip64': zip64,
+            'crc_actual': 0,
+            'decompressor': zlib.decompressobj(-15) if method == 8 else None,
+        }
+        
+        path = safe_member_path(self.target_dir, name)
+        if name.endswith(('/', '\\')):
+            if path:
+                os.makedirs(path, exist_ok=True)
+            self.out_file = None
+        elif path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.out_file = open(path, 'wb')
+        else:
+            # Имя целиком состоит из недопустимых частей - пропускаем данные
+            self.out_file = None
+        return True
+        
+    def _has_zip64_extra(self, extra):
+        offset = 0
+        while offset + 4 <= len(extra):
+            header_id, data_len = struct.unpack('<HH', extra[offset:offset + 4])
+            if header_id == 0x0001:
+                return True
+            offset += 4 + data_len
+        return False
+        
+    def _read_zip64_sizes(self, extra, comp_size, size):
+        offset = 0
+        while offset + 4 <= len(extra):
+            header_id, data_len = struct.unpack('<HH', extra[offset:offset + 4])
+            data = extra[offset + 4:offset + 4 + data_len]
+            if header_id == 0x0001:
+                values = [struct.unpack('<Q', data[i:i + 8])[0] for i in range(0, len(data) - 7, 8)]
+                if size == 0xFFFFFFFF and values:
+                    size = values.pop(0)
+                if comp_size == 0xFFFFFFFF and values:
+                    comp_size = values.pop(0)
+                return comp_size, size
+            offset += 4 + data_len
+        raise ZipStreamError("Поврежденный заголовок ZIP64")
+        
+    def _write(self, data):
+        if not data:
+            return
+        self.entry['crc_actual'] = zlib.crc32(data, self.entry['crc_actual'])
+        self.bytes_extracted += len(data)
+        if self.out_file:
+            self.out_file.write(data)
+            
+    def _read_entry_data(self):
+        entry = self.entry
+        if entry['remaining'] is None:
+            # Размер заранее неизвестен: читаем deflate-поток до его конца,
+            # остаток после конца потока принадлежит дескриптору и следующему файлу
+            data, self.buffer = self.buffer, b''
+            self.buffer = self._consume(data)
+            if not entry['decompressor'].eof:
+                return False
+            entry['remaining'] = 0
+        elif entry['remaining'] > 0:
+            take = self.buffer[:entry['remaining']]
+            self.buffer = self.buffer[len(take):]
+            entry['remaining'] -= len(take)
+            self._consume(take)
+            if entry['remaining'] > 0:
+                return False
+            if entry['decompressor']:
+                self._write(entry['decompressor'].flush())
+            
+        if entry['descriptor']:
+            if not self._read_descriptor():
+                return False
+        self._finish_entry()
+        return True
+        
+    def _consume(self, data):
+        """Передает сжатые данные элемента на запись, возвращает байты после конца потока"""
+        decompressor = self.entry['decompressor']
+        if decompressor is None:
+            self._write(data)
+            return b''
+        # Распаковываем порциями, чтобы не раздувать память на сильно сжатых данных
+        while data and not decompressor.eof:
+            self._write(decompressor.decompress(data, self.out_chunk_size))
+            data = decompressor.unconsumed_tail
+        if decompressor.eof:
+            return decompressor.unused_data + data
+        return b''
+            
+    def _read_descriptor(self):
+        size_len = 8 if self.entry['zip64'] else 4
+        need = 4 + 4 + size_len * 2
+        if len(self.buffer) < need:
+            return False
+        offset = 0
+        if struct.unpack('<I', self.buffer[:4])[0] == self.DATA_DESCRIPTOR:
+            offset = 4
+        if len(self.buffer) < offset + 4 + size_len * 2:
+            return False
+        self.entry['crc'] = struct.unpack('<I', self.buffer[offset:offset + 4])[0]
+        self.buffer = self.buffer[offset + 4 + size_len * 2:]
+        return True
+        
+    def _finish_entry(self):
+        entry = self.entry
+        if entry['crc_actual'] != entry['crc']:
+            self.abort()
+            raise ZipStreamError(f"Неверная контрольная сумма: {entry['name']}")
+        if self.out_file:
+            self.out_file.close()
+            self.out_file = None
+            self.files_extracted += 1
+        self.entry = None
+
+
+class ResourceCache:
+    """Дисковый кэш метаданных публичных ресурсов и ссылок на скачивание
+    
+    Для каждого вида записей свой срок жизни и свой лимит размера; при
+    превышении лимита удаляются давно не использованные записи (LRU).
+    """
+    # Срок жизни записей в секундах: ссылки на скачивание живут недолго
+    TTL = {'meta': 6 * 3600, 'href': 10 * 60}
+    # Лимит суммарного размера записей каждого вида в байтах
+    MAX_BYTES = {'meta': 16 * 1024 * 1024, 'href': 4 * 1024 * 1024}
+    # Поля метаданных, которые имеет смысл хранить
+    META_FIELDS = ('name', 'type', 'size', 'md5', 'sha256', 'modified', 'mime_type', 'path')
+    
+    def __init__(self, path):
+        import sqlite3
+        
+        self.path = path
+        self.lock = threading.Lock()
+        self.hits = {kind: 0 for kind in self.TTL}
+        self.misses = {kind: 0 for kind in self.TTL}
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " kind TEXT, key TEXT, value TEXT, expires REAL, accessed REAL, size INTEGER,"
+                " PRIMARY KEY (kind, key))")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (kind, accessed)")
+            # Оценка занятого объема: растет при каждой записи и пересчитывается
+            # только при вытеснении, чтобы put не сканировал всю таблицу
+            self.total_bytes = dict.fromkeys(self.TTL, 0)
+            self.total_bytes.update(self.conn.execute(
+                "SELECT kind, COALESCE(SUM(size), 0) FROM entries GROUP BY kind").fetchall())
+            
+    def get(self, kind, key, max_age=None):
+        """Возвращает значение из кэша или None, если записи нет или она устарела
+        
+        max_age - дополнительно не брать записи старше указанного числа секунд.
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT value, expires FROM entries WHERE kind=? AND key=?",
+                                    (kind, key)).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    self.conn.execute("DELETE FROM entries WHERE kind=? AND key=?", (kind, key))
+                self.misses[kind] += 1
+                return None
+            if max_age is not None and row[1] - self.TTL[kind] < now - max_age:
+                # Запись еще действительна, но слишком старая для этого запроса
+                self.misses[kind] += 1
+                return None
+            self.conn.execute("UPDATE entries SET accessed=? WHERE kind=? AND key=?", (now, kind, key))
+            self.hits[kind] += 1
+        return json.loads(row[0])
+        
+    def put(self, kind, key, value):
+        """Сохраняет значение и вытесняет старые записи при превышении лимита"""
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False)
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                              (kind, key, data, now + self.TTL[kind], now, len(data)))
+            self.total_bytes[kind] += len(data)
+            if self.total_bytes[kind] > self.MAX_BYTES[kind]:
+                self._evict(kind)
+            
+    def invalidate(self, kind, key):
+        """Удаляет запись из кэша"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM entries WHERE kind=? AND key=?", (kind, key))
+            
+    def _evict(self, kind):
+        # Сначала выбрасываем просроченные записи, затем самые давно использованные.
+        # Освобождаем с запасом до 90% лимита, чтобы вытеснение не запускалось на каждой записи
+        self.conn.execute("DELETE FROM entries WHERE kind=? AND expires<?", (kind, time.time()))
+        rows = self.conn.execute("SELECT key, size FROM entries WHERE kind=? ORDER BY accessed",
+                                 (kind,)).fetchall()
+        total = sum(size for _, size in rows)
+        target = self.MAX_BYTES[kind] * 9 // 10
+        stale = []
+        for key, size in rows:
+            if total <= target:
+                break
+            stale.append((kind, key))
+            total -= size
+        self.conn.executemany("DELETE FROM entries WHERE kind=? AND key=?", stale)
+        self.total_bytes[kind] = total
+            
+    def stats(self):
+        """Строка со счетчиками попаданий и промахов"""
+        names = {'meta': 'метаданные', 'href': 'ссылки'}
+        return ", ".join(f"{names[kind]} {self.hits[kind]}/{self.hits[kind] + self.misses[kind]}"
+                         for kind in self.TTL)
+
+
+class JobQueue:
+    """Файловая очередь заданий (SQLite) для нескольких процессов или машин
+    
+    Воркер берет задание в аренду и продлевает ее, пока качает. Если воркер
+    упал, аренда истекает и задание возвращается в очередь.
+    """
+    LEASE_SECONDS = 60
+    MAX_ATTEMPTS = 3
+    # Ожидание блокировки базы должно быть заметно короче аренды,
+    # иначе одно долгое ожидание при продлении аренды приведет к ее потере
+    LOCK_TIMEOUT = 15
+    
+    def __init__(self, path):
+        import sqlite3
+        
+        self.path = path
+        # Журнал в режиме DELETE, а не WAL: WAL не работает на сетевых дисках
+        self.conn = sqlite3.connect(path, timeout=self.LOCK_TIMEOUT, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY, link TEXT UNIQUE, state TEXT DEFAULT 'pending',"
+                " worker TEXT, lease_until REAL, attempts INTEGER DEFAULT 0,"
+                " bytes_done INTEGER DEFAULT 0, error TEXT, finished REAL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_until)")
+            
+    @contextlib.contextmanager
+    def transaction(self):
+        """Транзакция с блокировкой записи: два воркера не возьмут одно задание"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            
+    def clear(self):
+        """Удаляет все задания"""
+        with self.lock:
+            self.conn.execute("DELETE FROM jobs")
+            
+    def add_links(self, links):
+        """Добавляет ссылки в очередь, повторы игнорируются"""
+        with self.transaction():
+            self.conn.executemany("INSERT OR IGNORE INTO jobs (link) VALUES (?)",
+                                  [(link,) for link in links])
+                
+    def lease(self, worker_id):
+        """Берет следующее задание в аренду, возвращает (id, ссылка) или None"""
+        now = time.time()
+        with self.transaction():
+            # Задания упавших воркеров, исчерпавшие попытки, больше не выдаем
+            self.conn.execute(
+                "UPDATE jobs SET state='failed', error='Превышено число попыток', finished=?"
+                " WHERE state='leased' AND lease_until<? AND attempts>=?",
+                (now, now, self.MAX_ATTEMPTS))
+            row = self.conn.execute(
+                "SELECT id, link FROM jobs WHERE state='pending'"
+                " OR (state='leased' AND lease_until<?) ORDER BY id LIMIT 1", (now,)).fetchone()
+            if row:
+                self.conn.execute(
+                    "UPDATE jobs SET state='leased', worker=?, lease_until=?,"
+                    " attempts=attempts+1, bytes_done=0 WHERE id=?",
+                    (worker_id, now + self.LEASE_SECONDS, row[0]))
+        return row
+        
+    def heartbeat(self, job_id, worker_id, bytes_done):
+        """Продлевает аренду; False - аренду уже забрал другой воркер"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET lease_until=?, bytes_done=? WHERE id=? AND worker=? AND state='leased'",
+                (time.time() + self.LEASE_SECONDS, bytes_done, job_id, worker_id))
+        return cursor.rowcount == 1
+        
+    def finish(self, job_id, worker_id, ok, error=None):
+        """Отмечает задание выполненным или ошибочным"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET state=?, error=?, finished=?, lease_until=NULL"
+                " WHERE id=? AND worker=? AND state='leased'",
+                ('done' if ok else 'failed', error, time.time(), job_id, worker_id))
+            
+    def progress(self):
+        """Сводный прогресс всех воркеров"""
+        now = time.time()
+        with self.lock:
+            counts = dict(self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+            bytes_done, workers = self.conn.execute(
+                "SELECT COALESCE(SUM(bytes_done), 0), COUNT(DISTINCT CASE WHEN state='leased'"
+                " AND lease_until>=? THEN worker END) FROM jobs", (now,)).fetchone()
+        return {
+            'total': sum(counts.values()),
+            'pending': counts.get('pending', 0),
+            'leased': counts.get('leased', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'bytes': bytes_done,
+            'workers': workers,
+        }
+        
+    def active(self):
+        """Задания в работе: (ссылка, скачано байт, число попыток)"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT link, bytes_done, attempts FROM jobs WHERE state='leased'").fetchall()
+            
+    def finished_since(self, since):
+        """Задания, завершенные после момента since: (id, ссылка, состояние, ошибка, время)"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT id, link, state, error, finished FROM jobs"
+                " WHERE state IN ('done', 'failed') AND finished>=? ORDER BY finished",
+                (since,)).fetchall()
+
+
+class WriterFile:
+    """Файл, запись в который выполняет DiskWriter"""
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.error = None
+        self.unsynced = 0
+        self.final_path = None
+
+
+class DiskWriter:
+    """Отдельный поток записи на диск с ограниченным буфером
+    
+    Сетевой поток отдает порции данных в очередь и сразу читает дальше, а запись
+    идет параллельно. Когда в очереди набирается memory_budget байт, write()
+    ждет освобождения места, чтобы медленный диск не раздувал память.
+    
+    Политики fsync: 'none' - не вызывать, 'close' - при закрытии каждого файла,
+    'batch' - каждые fsync_batch_bytes байт и при закрытии, 'deferred' - один раз
+    для всех файлов в sync_deferred() в конце пакета.
+    """
+    FSYNC_POLICIES = ('none', 'close', 'batch', 'deferred')
+    
+    def __init__(self, memory_budget=32 * 1024 * 1024, fsync_policy='none',
+                 fsync_batch_bytes=64 * 1024 * 1024):
+        if fsync_policy not in self.FSYNC_POLICIES:
+            raise ValueError(f"Неизвестная политика fsync: {fsync_policy}")
+        self.memory_budget = memory_budget
+        self.fsync_policy = fsync_policy
+        self.fsync_batch_bytes = fsync_batch_bytes
+        self.ops = collections.deque()
+        self.buffered = 0
+        self.peak_buffered = 0
+        self.deferred_paths = []
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        
+    def open(self, path):
+        """Регистрирует файл для записи (сам файл открывается в потоке записи)"""
+        handle = WriterFile(path)
+        self._submit(('open', handle, None, None), 0)
+        return handle
+        
+    def write(self, handle, data):
+        """Ставит данные в очередь; блокируется, пока буфер заполнен"""
+        if handle.error:
+            raise handle.error
+        self._submit(('write', handle, data, None), len(data))
+        
+    def close(self, handle, final_path=None):
+        """Дожидается записи всех данных файла; ошибку записи пробрасывает
+        
+        final_path - переименовать файл после записи (например, из .part); может быть
+        функцией, которая вызывается после записи и возвращает путь. Для политики
+        'deferred' запоминается итоговый путь, а не временный.
+        """
+        handle.final_path = final_path
+        done = threading.Event()
+        self._submit(('close', handle, None, done), 0)
+        done.wait()
+        if handle.error:
+            raise handle.error
+            
+    def abort(self, handle):
+        """Отбрасывает недописанный файл и удаляет его"""
+        done = threading.Event()
+        self._submit(('abort', handle, None, done), 0)
+        done.wait()
+        
+    def occupancy(self):
+        """Текущая и пиковая заполненность буфера в байтах"""
+        with self.condition:
+            return self.buffered, self.peak_buffered
+            
+    def sync_deferred(self):
+        """Для политики 'deferred': сбрасывает на диск все файлы, записанные с прошлого вызова
+        
+        Возвращает список (путь, ошибка) для файлов, которые сбросить не удалось.
+        """
+        with self.condition:
+            paths, self.deferred_paths = self.deferred_paths, []
+        failed = []
+        for path in paths:
+            try:
+                # На Windows FlushFileBuffers требует права записи, поэтому O_RDWR
+                fd = os.open(path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                failed.append((path, e))
+        return failed
+                
+    def _submit(self, op, size):
+        with self.condition:
+            # Обратное давление: ждем, пока поток записи не освободит место
+            while self.buffered and self.buffered + size > self.memory_budget:
+                self.condition.wait()
+            self.ops.append(op)
+            self.buffered += size
+            self.peak_buffered = max(self.peak_buffered, self.buffered)
+            self.condition.notify_all()
+            
+    def shutdown(self):
+        """Дописывает очередь и останавливает поток записи"""
+        self._submit(('shutdown', None, None, None), 0)
+        self.thread.join()
+        
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.ops:
+                    self.condition.wait()
+                kind, handle, data, done = self.ops.popleft()
+            if kind == 'shutdown':
+                break
+            try:
+                self._apply(kind, handle, data)
+            except Exception as e:
+                # Любая ошибка относится к файлу, а не к потоку: иначе поток умрет,
+                # и close()/write() будут ждать вечно
+                handle.error = e
+                if handle.file:
+                    with contextlib.suppress(Exception):
+                        handle.file.close()
+                    handle.file = None
+            finally:
+                if done:
+                    done.set()
+                if data:
+                    with self.condition:
+                        self.buffered -= len(data)
+                        self.condition.notify_all()
+                        
+    def _apply(self, kind, handle, data):
+        if kind == 'open':
+            handle.file = open(handle.path, 'wb')
+        elif kind == 'write':
+            # После ошибки записи оставшиеся данные файла просто отбрасываем
+            if handle.file and not handle.error:
+                handle.file.write(data)
+                handle.unsynced += len(data)
+                if self.fsync_policy == 'batch' and handle.unsynced >= self.fsync_batch_bytes:
+                    self._fsync(handle)
+        elif kind == 'close':
+            if handle.file:
+                if self.fsync_policy in ('close', 'batch'):
+                    self._fsync(handle)
+                handle.file.close()
+                handle.file = None
+                if handle.final_path:
+                    final_path = handle.final_path() if callable(handle.final_path) else handle.final_path
+                    os.replace(handle.path, final_path)
+                    handle.path = final_path
+                if self.fsync_policy == 'deferred':
+                    with self.condition:
+                        self.deferred_paths.append(handle.path)
+        elif kind == 'abort':
+            if handle.file:
+                handle.file.close()
+                handle.file = None
+            if os.path.exists(handle.path):
+                os.remove(handle.path)
+            
+    def _fsync(self, handle):
+        handle.file.flush()
+        os.fsync(handle.file.fileno())
+        handle.unsynced = 0
 
-# Попробуем импортировать tkinterdnd2 для Drag&Drop
-try:
-    from tkinterdnd2 import DND_FILES, TkinterDnD
-    DND_AVAILABLE = True
-except ImportError:
-    DND_AVAILABLE = False
-    print("Для Drag&Drop установите: pip install tkinterdnd2")
 
 class RoundedFrame(tk.Frame):
     """Кастомный фрейм с эффектом скругленных углов"""
@@ -72,8 +726,896 @@ class RoundedButton(tk.Frame):
         darker = tuple(max(0, c - amount) for c in rgb)
         return f'#{darker[0]:02x}{darker[1]:02x}{darker[2]:02x}'
 
-class YandexDiskDownloader:
+class JobModel:
+    """Компактная модель заданий для больших пакетов
+    
+    Каждый столбец хранится в своем array, поэтому 100 тысяч ссылок занимают
+    несколько мегабайт, а сортировка и фильтрация идут по плоским массивам.
+    """
+    PENDING, ACTIVE, DONE, FAILED = range(4)
+    STATE_NAMES = ('ожидает', 'загрузка', 'готово', 'ошибка')
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+        
+    def clear(self):
+        """Удаляет все задания"""
+        with self.lock:
+            self.links = []
+            self.index_by_link = {}
+            self.errors = {}  # ошибки редки, храним только для упавших заданий
+            self.state = array.array('b')
+            self.size = array.array('q')
+            self.speed = array.array('d')
+            self.retries = array.array('l')
+            # Версия растет при любом изменении, в том числе при очистке
+            self.version = getattr(self, 'version', 0) + 1
+            
+    def __len__(self):
+        return len(self.links)
+        
+    def add(self, links):
+        """Добавляет ссылки и возвращает индексы новых заданий"""
+        with self.lock:
+            start = len(self.links)
+            self.links.extend(links)
+            count = len(self.links) - start
+            for i, link in enumerate(links, start):
+                self.index_by_link.setdefault(link, i)
+            self.state.extend([self.PENDING] * count)
+            self.size.extend([0] * count)
+            self.speed.extend([0.0] * count)
+            self.retries.extend([0] * count)
+            self.version += 1
+        return list(range(start, start + count))
+        
+    def update(self, index, state=None, size=None, speed=None, error=None, retries=None):
+        """Обновляет поля задания (None - оставить как есть)"""
+        if state is not None:
+            self.state[index] = state
+        if size is not None:
+            self.size[index] = size
+        if speed is not None:
+            self.speed[index] = speed
+        if retries is not None:
+            self.retries[index] = retries
+        if error is not None:
+            self.errors[index] = error
+        elif state in (self.PENDING, self.ACTIVE, self.DONE):
+            self.errors.pop(index, None)
+        self.version += 1
+        
+    def requeue(self, indexes):
+        """Возвращает задания в ожидание, увеличивая счетчик повторов"""
+        with self.lock:
+            for index in indexes:
+                self.retries[index] += 1
+                self.update(index, state=self.PENDING, size=0, speed=0.0)
+                
+    def indexes_in_state(self, state):
+        return [i for i, value in enumerate(self.state) if value == state]
+        
+    def view(self, sort_column=None, reverse=False, state=None, text=''):
+        """Индексы заданий с учетом фильтра и сортировки"""
+        with self.lock:
+            if state is None:
+                indexes = range(len(self.links))
+            else:
+                indexes = self.indexes_in_state(state)
+            if text:
+                text = text.lower()
+                indexes = [i for i in indexes if text in self.links[i].lower()]
+            if sort_column == 'link':
+                key = self.links.__getitem__
+            elif sort_column == 'error':
+                key = lambda i: self.errors.get(i, '')
+            elif sort_column in ('state', 'size', 'speed', 'retries'):
+                key = getattr(self, sort_column).__getitem__
+            else:
+                return list(indexes)[::-1] if reverse else list(indexes)
+            return sorted(indexes, key=key, reverse=reverse)
+            
+    def row(self, index):
+        """Значения строки таблицы для отображения"""
+        size = self.size[index]
+        speed = self.speed[index]
+        return (
+            index + 1,
+            self.STATE_NAMES[self.state[index]],
+            f"{size / 1024 / 1024:.1f} МБ" if size else "",
+            f"{speed / 1024 / 1024:.2f} МБ/с" if speed else "",
+            self.retries[index] or "",
+            self.links[index],
+            self.errors.get(index, ""),
+        )
+
+
+class JobTable(tk.Frame):
+    """Таблица заданий, которая отрисовывает только видимые строки
+    
+    Treeview держит фиксированное число строк, а при прокрутке в них
+    подставляются данные из JobModel - так таблица не тормозит на 100 тысячах ссылок.
+    """
+    COLUMNS = (('index', '#', 50), ('state', 'Статус', 80), ('size', 'Размер', 80),
+               ('speed', 'Скорость', 90), ('retries', 'Повт.', 45),
+               ('link', 'Ссылка', 300), ('error', 'Ошибка', 250))
+    ROW_HEIGHT = 20
+    
+    def __init__(self, parent, model, bg='white', **kwargs):
+        super().__init__(parent, bg=bg, **kwargs)
+        self.model = model
+        self.offset = 0
+        self.visible_rows = 0
+        self.sort_column = None
+        self.sort_reverse = False
+        self.state_filter = None
+        self.text_filter = ''
+        self.view = []
+        self.view_version = None
+        self.view_dirty = True
+        
+        style = ttk.Style(self)
+        style.configure('Jobs.Treeview', rowheight=self.ROW_HEIGHT, font=('Arial', 8))
+        
+        table_frame = tk.Frame(self, bg=bg)
+        table_frame.pack(fill=tk.BOTH, expand=True)
+        
+        self.tree = ttk.Treeview(table_frame, columns=[c[0] for c in self.COLUMNS],
+                                 show='headings', style='Jobs.Treeview', selectmode='extended')
+        for column, title, width in self.COLUMNS:
+            self.tree.heading(column, text=title, command=lambda c=column: self.sort_by(c))
+            self.tree.column(column, width=width, stretch=column in ('link', 'error'), anchor=tk.W)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        self.scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.tree.bind('<Configure>', self.on_resize)
+        self.tree.bind('<MouseWheel>', self.on_mousewheel)
+        self.tree.bind('<Button-4>', lambda e: self.scroll_to(self.offset - 3))
+        self.tree.bind('<Button-5>', lambda e: self.scroll_to(self.offset + 3))
+        
+    def set_filter(self, state=None, text=''):
+        self.state_filter = state
+        self.text_filter = text
+        self.view_dirty = True
+        self.offset = 0
+        self.refresh()
+        
+    def sort_by(self, column):
+        if column == 'index':
+            column = None
+        if self.sort_column == column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column, self.sort_reverse = column, False
+        self.view_dirty = True
+        self.refresh()
+        
+    def selected_indexes(self):
+        """Индексы заданий в модели для выделенных строк"""
+        result = []
+        for iid in self.tree.selection():
+            position = self.offset + int(iid)
+            if position < len(self.view):
+                result.append(self.view[position])
+        return result
+        
+    def on_resize(self, event):
+        # Высота заголовка примерно равна высоте строки
+        rows = max(1, event.height // self.ROW_HEIGHT - 1)
+        if rows != self.visible_rows:
+            for iid in range(self.visible_rows, rows):
+                self.tree.insert('', tk.END, iid=str(iid), values=())
+            for iid in range(rows, self.visible_rows):
+                self.tree.delete(str(iid))
+            self.visible_rows = rows
+            self.refresh()
+            
+    def on_mousewheel(self, event):
+        self.scroll_to(self.offset - int(event.delta / 120) * 3)
+        return 'break'
+        
+    def on_scrollbar(self, action, value, unit=None):
+        if action == 'moveto':
+            self.scroll_to(int(float(value) * len(self.view)))
+        elif action == 'scroll':
+            step = self.visible_rows if unit == 'pages' else 1
+            self.scroll_to(self.offset + int(value) * step)
+            
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, len(self.view) - self.visible_rows))
+        if offset != self.offset:
+            self.offset = offset
+            self.tree.selection_remove(self.tree.selection())
+            self.refresh()
+            
+    def refresh(self):
+        """Перестраивает выборку при изменении модели и перерисовывает видимые строки"""
+        if self.view_dirty or self.view_version != self.model.version:
+            # При сортировке по изменяемым столбцам порядок нужно пересчитать,
+            # без сортировки и фильтра по статусу достаточно длины модели
+            if self.view_dirty or self.sort_column or self.state_filter is not None or \
+                    self.text_filter or len(self.view) != len(self.model):
+                self.view = self.model.view(self.sort_column, self.sort_reverse,
+                                            self.state_filter, self.text_filter)
+            self.view_version = self.model.version
+            self.view_dirty = False
+            self.offset = max(0, min(self.offset, len(self.view) - self.visible_rows))
+            
+        for row in range(self.visible_rows):
+            position = self.offset + row
+            values = self.model.row(self.view[position]) if position < len(self.view) else ()
+            self.tree.item(str(row), values=values)
+            
+        total = len(self.view)
+        if total > self.visible_rows:
+            self.scrollbar.set(self.offset / total, (self.offset + self.visible_rows) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+
+# Служебные файлы синхронизации в локальной копии папки
+SYNC_MANIFEST = ".yandex_sync.json"
+SYNC_REPORT = ".yandex_sync_report.json"
+
+
+class DownloaderCore:
+    """Логика скачивания без интерфейса: используется окном и фоновыми воркерами"""
+    # Классы проверки, при которых ссылка точно недоступна; лимит запросов и прочие
+    # ошибки временные - такие ссылки все равно пробуем скачать
+    UNAVAILABLE = ('not_found', 'denied')
+    # Предварительная проверка доверяет метаданным из кэша не старше этого срока (сек)
+    PREFLIGHT_MAX_AGE = 15 * 60
+    
+    def __init__(self):
+        self.is_downloading = False
+        self.stream_extract = False
+        self.keep_zip_on_error = True
+        self.cache = None  # создается при первой загрузке
+        self.cache_disabled = False  # кэш не удалось открыть - больше не пытаемся
+        self.cache_lock = threading.Lock()
+        self.writer = None  # поток записи на диск, создается при первой загрузке
+        self.write_buffer_mb = 32
+        self.fsync_policy = 'none'  # по умолчанию без fsync, как и до появления потока записи
+        self.last_error = None
+        self.sync_mode = False
+        self.sync_prune = False
+        
+    def log(self, message):
+        self.capture_error(message)
+        print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+        
+    def capture_error(self, message):
+        """Запоминает последнее сообщение об ошибке для текущего задания"""
+        if message.startswith(("Ошибка", "✗")):
+            self.last_error = message
+        
+    def report_progress(self, nbytes):
+        """Вызывается после записи очередной порции данных на диск"""
+        
+    def get_base_dir(self):
+        """Папка рядом с исполняемым файлом или скриптом"""
+        if getattr(sys, 'frozen', False):
+            return os.path.dirname(sys.executable)
+        return os.path.dirname(os.path.abspath(__file__))
+        
+    def download_file_correct(self, public_key, save_path):
+        """Скачивает файл используя API Яндекс.Диска"""
+        try:
+            download_url, download_response = self.open_download(public_key)
+            if download_response is None:
+                return False
+                
+            # Метаданные из кэша (их сохраняет предварительная проверка) дают точное
+            # имя и тип ресурса без отдельного запроса к API
+            meta = self.get_cached_metadata(public_key)
+            filename = self.get_filename_from_url(download_url) or f"file_{int(time.time())}.downloaded"
+            if meta and meta.get('type') == 'file' and meta.get('name'):
+                filename = meta['name']
+            
+            # Папка приходит ZIP-архивом - при включенной опции распаковываем его на лету
+            if self.stream_extract and self.is_folder_archive(meta, download_url):
+                extracted = self.download_and_extract(download_response, filename, save_path, public_key)
+                if extracted is not None:
+                    return extracted
+                self.log("Сохраняем архив без распаковки")
+                download_url, download_response = self.open_download(public_key)
+                if download_response is None:
+                    return False
+                
+            safe_filename = sanitize_filename(filename)
+            self.log(f"Скачивание: {safe_filename}")
+            
+            if download_response.status_code == 200:
+                # Качаем во временный файл, а свободное итоговое имя занимаем только после
+                # загрузки: при сбое под настоящим именем не остается обрезанного файла
+                part_path = self.get_part_path(save_path, safe_filename, public_key)
+                if not self.save_response(download_response, part_path,
+                                          lambda: self.get_unique_path(save_path, safe_filename)):
+                    return False
+                
+                self.log(f"✓ Успешно: {safe_filename}")
+                return True
+            else:
+                self.log(f"Ошибка загрузки: {download_response.status_code}")
+                return False
+                
+        except Exception as e:
+            self.log(f"Ошибка скачивания: {str(e)}")
+            return False
+            
+    def save_response(self, download_response, full_path, final_path=None):
+        """Сохраняет поток ответа в файл; False - загрузка остановлена пользователем
+        
+        final_path - куда переименовать файл после успешной записи (путь или функция,
+        возвращающая путь).
+        """
+        # Сеть читает дальше, пока поток записи сбрасывает данные на диск
+        writer = self.get_writer()
+        handle = writer.open(full_path)
+        try:
+            for chunk in download_response.iter_content(chunk_size=65536):
+                if not self.is_downloading:
+                    writer.abort(handle)
+                    return False
+                if chunk:
+                    writer.write(handle, chunk)
+                    self.report_progress(len(chunk))
+            writer.close(handle, final_path)
+        except Exception:
+            writer.abort(handle)
+            raise
+        return True
+        
+    def process_link(self, public_key, save_path):
+        """Обрабатывает одну ссылку: синхронизация папки или обычное скачивание"""
+        if self.sync_mode:
+            return self.sync_public_folder(public_key, save_path)
+        return self.download_file_correct(public_key, save_path)
+        
+    def check_link(self, public_key, attempts=3):
+        """Классифицирует ссылку по метаданным: file, dir, not_found, denied, rate_limited, error
+        
+        Возвращает пару (класс, метаданные или текст ошибки).
+        """
+        for attempt in range(attempts):
+            try:
+                # Проверка должна отражать текущее состояние ссылки: запрашиваем API,
+                # если в кэше нет свежей записи
+                meta, status = self.get_public_metadata(public_key, max_age=self.PREFLIGHT_MAX_AGE)
+            except Exception as e:
+                return 'error', str(e)
+            if meta is not None:
+                return ('dir' if meta.get('type') == 'dir' else 'file'), meta
+            if status == 429:
+                # Лимит запросов: ждем и пробуем еще раз
+                time.sleep(1 + attempt * 2)
+                continue
+            if status == 404:
+                return 'not_found', "Ресурс не найден"
+            if status in (401, 403):
+                return 'denied', "Нет доступа"
+            return 'error', f"Ответ API: {status}"
+        return 'rate_limited', "Превышен лимит запросов"
+        
+    def preflight_links(self, links, workers=16, progress_callback=None):
+        """Параллельно проверяет ссылки до начала загрузки
+        
+        Возвращает {ссылка: (класс, метаданные или текст ошибки)}. Метаданные
+        попадают в кэш, поэтому последующая загрузка не запрашивает их повторно.
+        """
+        import concurrent.futures
+        
+        results = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.check_link, link): link for link in links}
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                if progress_callback:
+                    progress_callback(done, len(futures))
+        return results
+        
+    def preflight_summary(self, results, elapsed):
+        """Сводка предварительной проверки для лога"""
+        counts = collections.Counter(category for category, _ in results.values())
+        total_bytes = sum(meta.get('size', 0) for category, meta in results.values() if category == 'file')
+        return (f"Проверено {len(results)} ссылок за {elapsed:.1f} с: "
+                f"файлов {counts['file']} ({total_bytes / 1024 / 1024 / 1024:.2f} ГБ), "
+                f"папок {counts['dir']} (размер не учитывается), "
+                f"не найдено {counts['not_found']}, нет доступа {counts['denied']}, "
+                f"лимит запросов {counts['rate_limited']}, ошибок {counts['error']}"
+                + (f" (не проверено {counts['rate_limited'] + counts['error']}, будут загружены)"
+                   if counts['rate_limited'] or counts['error'] else ""))
+        
+    def list_public_folder(self, public_key, path='/'):
+        """Рекурсивно собирает файлы публичной папки: {относительный путь: метаданные}"""
+        import requests
+        
+        files = {}
+        folders = [path]
+        while folders:
+            folder = folders.pop()
+            offset = 0
+            while True:
+                params = dict(public_key=public_key, path=folder, limit=1000, offset=offset)
+                response = requests.get('https://cloud-api.yandex.net/v1/disk/public/resources?'
+                                        + urlencode(params), timeout=30)
+                if response.status_code != 200:
+                    raise RuntimeError(f"Ошибка получения списка {folder}: {response.status_code}")
+                embedded = response.json().get('_embedded', {})
+                items = embedded.get('items', [])
+                for item in items:
+                    if item.get('type') == 'dir':
+                        folders.append(item['path'])
+                        continue
+                    meta = {field: item[field] for field in ResourceCache.META_FIELDS if field in item}
+                    files[item['path'].lstrip('/')] = meta
+                offset += len(items)
+                if not items or offset >= embedded.get('total', 0):
+                    break
+        return files
+        
+    def sync_public_folder(self, public_key, save_path):
+        """Инкрементальная синхронизация публичной папки с локальной копией
+        
+        Сравнивает список файлов на Диске с локальным манифестом и скачивает только
+        новые и измененные файлы; при включенной опции удаляет файлы, удаленные на Диске.
+        """
+        try:
+            meta, status = self.get_public_metadata(public_key)
+            if meta is None:
+                self.log(f"Ошибка получения метаданных: {status}")
+                return False
+            if meta.get('type') != 'dir':
+                self.log("Ссылка ведет на файл, синхронизация не нужна - обычное скачивание")
+                return self.download_file_correct(public_key, save_path)
+                
+            folder_name = sanitize_filename(meta.get('name', '')) or f"folder_{int(time.time())}"
+            target_dir = os.path.join(save_path, folder_name)
+            os.makedirs(target_dir, exist_ok=True)
+            manifest_path = os.path.join(target_dir, SYNC_MANIFEST)
+            manifest = self.load_manifest(manifest_path, public_key)
+            
+            self.log(f"Синхронизация: {folder_name}")
+            remote = self.list_public_folder(public_key)
+        except Exception as e:
+            self.log(f"Ошибка синхронизации: {str(e)}")
+            return False
+            
+        report = {'folder': folder_name, 'public_key': public_key, 'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+                  'added': [], 'changed': [], 'deleted': [], 'pruned': [], 'failed': [],
+                  'unchanged': 0, 'bytes': 0}
+        local_files = manifest['files']
+        pending_saves = 0
+        
+        for rel_path, remote_meta in sorted(remote.items()):
+            if not self.is_downloading:
+                break
+            local_path = safe_member_path(target_dir, rel_path)
+            if local_path is None:
+                continue
+            known = local_files.get(rel_path)
+            if known is not None and not self.is_file_changed(known, remote_meta, local_path):
+                report['unchanged'] += 1
+                continue
+                
+            kind = 'added' if known is None else 'changed'
+            self.log(f"{'Новый' if kind == 'added' else 'Изменен'}: {rel_path}")
+            try:
+                if not self.download_sync_file(public_key, remote_meta['path'], local_path):
+                    if self.is_downloading:
+                        report['failed'].append(rel_path)
+                    continue
+            except Exception as e:
+                self.log(f"Ошибка скачивания {rel_path}: {str(e)}")
+                report['failed'].append(rel_path)
+                continue
+            report[kind].append(rel_path)
+            report['bytes'] += remote_meta.get('size', 0)
+            local_files[rel_path] = remote_meta
+            
+            # Манифест сохраняем периодически, чтобы прерванная синхронизация продолжилась с места остановки
+            pending_saves += 1
+            if pending_saves >= 50:
+                self.save_json(manifest_path, manifest)
+                pending_saves = 0
+                
+        if self.is_downloading:
+            for rel_path in sorted(set(local_files) - set(remote)):
+                report['deleted'].append(rel_path)
+                if self.sync_prune:
+                    local_path = safe_member_path(target_dir, rel_path)
+                    if local_path and os.path.isfile(local_path):
+                        os.remove(local_path)
+                        self.remove_empty_dirs(os.path.dirname(local_path), target_dir)
+                    report['pruned'].append(rel_path)
+                    del local_files[rel_path]
+                    
+        self.save_json(manifest_path, manifest)
+        report['finished'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.save_json(os.path.join(target_dir, SYNC_REPORT), report)
+        
+        self.log(f"Синхронизация {folder_name}: новых {len(report['added'])}, "
+                 f"измененных {len(report['changed'])}, без изменений {report['unchanged']}, "
+                 f"удалено на Диске {len(report['deleted'])} (удалено локально {len(report['pruned'])}), "
+                 f"ошибок {len(report['failed'])}, скачано {report['bytes'] / 1024 / 1024:.1f} МБ")
+        return self.is_downloading and not report['failed']
+        
+    def is_file_changed(self, known, remote_meta, local_path):
+        """Сравнивает запись манифеста с метаданными на Диске и наличием локального файла"""
+        if not os.path.isfile(local_path):
+            return True
+        if 'size' in remote_meta and os.path.getsize(local_path) != remote_meta['size']:
+            return True
+        for field in ('sha256', 'md5', 'size', 'modified'):
+            if field in remote_meta and known.get(field) != remote_meta[field]:
+                return True
+        return False
+        
+    def download_sync_file(self, public_key, remote_path, local_path):
+        """Скачивает файл папки во временный файл и заменяет им локальную копию"""
+        download_url, download_response = self.open_download(public_key, remote_path)
+        if download_response is None:
+            return False
+        if download_response.status_code != 200:
+            self.log(f"Ошибка загрузки: {download_response.status_code}")
+            return False
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        # Переименование выполняет поток записи, чтобы отложенный fsync получил итоговый путь
+        return self.save_response(download_response, local_path + '.part', local_path)
+        
+    def load_manifest(self, manifest_path, public_key):
+        """Читает манифест синхронизации; при несовпадении ссылки начинает заново"""
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('public_key') == public_key and isinstance(manifest.get('files'), dict):
+                return manifest
+        except (OSError, ValueError):
+            pass
+        return {'public_key': public_key, 'files': {}}
+        
+    def save_json(self, path, data):
+        """Атомарно записывает JSON-файл"""
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, path)
+        
+    def remove_empty_dirs(self, folder, stop_at):
+        """Удаляет опустевшие папки вверх по дереву до stop_at"""
+        stop_at = os.path.abspath(stop_at)
+        folder = os.path.abspath(folder)
+        while folder != stop_at and folder.startswith(stop_at):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                break
+            folder = os.path.dirname(folder)
+            
+    def get_writer(self):
+        """Возвращает поток записи на диск, создавая его при первом обращении"""
+        if self.writer is None:
+            self.writer = DiskWriter(self.write_buffer_mb * 1024 * 1024, self.fsync_policy)
+        return self.writer
+        
+    def sync_writer(self):
+        """Выполняет отложенный fsync и сообщает о файлах, которые не удалось сбросить на диск"""
+        if self.writer is None:
+            return
+        for path, error in self.writer.sync_deferred():
+            self.log(f"Ошибка сброса на диск {os.path.basename(path)}: {str(error)}")
+            
+    def writer_stats(self):
+        """Строка с заполненностью буфера записи"""
+        if self.writer is None:
+            return ""
+        buffered, peak = self.writer.occupancy()
+        return (f"буфер записи {buffered / 1024 / 1024:.1f}/{self.write_buffer_mb} МБ "
+                f"(пик {peak / 1024 / 1024:.1f} МБ)")
+        
+    def get_cache(self):
+        """Возвращает дисковый кэш API, создавая его при первом обращении"""
+        if self.cache is None and not self.cache_disabled:
+            import sqlite3
+            
+            # Блокировка: потоки предварительной проверки обращаются к кэшу одновременно
+            with self.cache_lock:
+                if self.cache is None and not self.cache_disabled:
+                    try:
+                        self.cache = ResourceCache(os.path.join(self.get_base_dir(),
+                                                                "yandex_api_cache.sqlite3"))
+                    except (sqlite3.Error, OSError) as e:
+                        self.cache_disabled = True
+                        self.log(f"Кэш API недоступен, работаем без него: {str(e)}")
+        return self.cache
+        
+    def cache_key(self, public_key, path=None):
+        """Ключ кэша для ресурса (и вложенного пути внутри публичной папки)"""
+        return f"{public_key}|{path}" if path else public_key
+        
+    def get_cached_metadata(self, public_key, path=None):
+        """Метаданные ресурса из кэша без обращения к API (None, если их нет)"""
+        cache = self.get_cache()
+        return cache.get('meta', self.cache_key(public_key, path)) if cache else None
+        
+    def get_public_metadata(self, public_key, path=None, max_age=None):
+        """Возвращает метаданные публичного ресурса (из кэша или API)
+        
+        Возвращает пару (метаданные или None, код ответа API).
+        max_age - брать из кэша только записи не старше указанного числа секунд.
+        """
+        import requests
+        
+        cache = self.get_cache()
+        key = self.cache_key(public_key, path)
+        if cache:
+            meta = cache.get('meta', key, max_age)
+            if meta is not None:
+                return meta, 200
+                
+        params = dict(public_key=public_key)
+        if path:
+            params['path'] = path
+        response = requests.get('https://cloud-api.yandex.net/v1/disk/public/resources?' + urlencode(params),
+                                timeout=30)
+        if response.status_code != 200:
+            return None, response.status_code
+            
+        data = response.json()
+        meta = {field: data[field] for field in ResourceCache.META_FIELDS if field in data}
+        if cache:
+            cache.put('meta', key, meta)
+        return meta, 200
+        
+    def get_download_href(self, public_key, path=None, refresh=False):
+        """Возвращает (ссылка на скачивание, взята ли она из кэша)"""
+        import requests
+        
+        cache = self.get_cache()
+        key = self.cache_key(public_key, path)
+        if cache and not refresh:
+            cached = cache.get('href', key)
+            if cached is not None:
+                return cached, True
+                
+        params = dict(public_key=public_key)
+        if path:
+            params['path'] = path
+        base_url = 'https://cloud-api.yandex.net/v1/disk/public/resources/download?'
+        final_url = base_url + urlencode(params)
+        response = requests.get(final_url, timeout=30)
+        
+        if response.status_code != 200:
+            self.log(f"Ошибка получения ссылки: {response.status_code}")
+            return None, False
+            
+        download_url = response.json()['href']
+        if cache:
+            cache.put('href', key, download_url)
+        return download_url, False
+        
+    def open_download(self, public_key, path=None):
+        """Открывает поток скачивания, обновляя устаревшую ссылку из кэша
+        
+        Возвращает пару (ссылка, ответ) или (None, None) если ссылку получить не удалось.
+        """
+        import requests  # ленивый импорт: модуль нужен только при скачивании
+        
+        download_url, from_cache = self.get_download_href(public_key, path)
+        if download_url is None:
+            return None, None
+        download_response = requests.get(download_url, stream=True, timeout=60)
+        
+        if from_cache and download_response.status_code in (403, 404, 410):
+            # Ссылка из кэша протухла раньше срока - запрашиваем новую
+            download_response.close()
+            self.get_cache().invalidate('href', self.cache_key(public_key, path))
+            download_url, _ = self.get_download_href(public_key, path, refresh=True)
+            if download_url is None:
+                return None, None
+            download_response = requests.get(download_url, stream=True, timeout=60)
+        return download_url, download_response
+        
+    def get_unique_path(self, save_path, safe_filename, is_dir=False):
+        """Занимает свободный путь, добавляя номер если файл уже существует
+        
+        Файл (или папка) создается сразу, чтобы параллельные воркеры не выбрали
+        одно и то же имя.
+        """
+        full_path = os.path.join(save_path, safe_filename)
+        counter = 1
+        while True:
+            try:
+                if is_dir:
+                    os.mkdir(full_path)
+                else:
+                    os.close(os.open(full_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return full_path
+            except FileExistsError:
+                name, ext = (safe_filename, '') if is_dir else os.path.splitext(safe_filename)
+                full_path = os.path.join(save_path, f"{name}_{counter}{ext}")
+                counter += 1
+        
+    def get_part_path(self, save_path, name, public_key):
+        """Временный путь загрузки ссылки, одинаковый для всех ее попыток
+        
+        Повторная загрузка той же ссылки (например, после падения воркера) перезаписывает
+        недокачанный .part, а не создает рядом копию под новым именем.
+        """
+        return os.path.join(save_path, f"{name}.{zlib.crc32(public_key.encode()):08x}.part")
+        
+    def is_folder_archive(self, meta, download_url):
+        """Проверяет, что ссылка на скачивание ведет на ZIP-архив папки"""
+        if meta and 'type' in meta:
+            return meta['type'] == 'dir'
+        return '/zip/' in urlparse(download_url).path
+        
+    def download_and_extract(self, download_response, filename, save_path, public_key):
+        """Скачивает архив папки и распаковывает его по мере загрузки
+        
+        Возвращает True/False как download_file_correct, либо None если распаковка
+        не удалась и архив нужно сохранить целиком.
+        """
+        folder_name = sanitize_filename(os.path.splitext(filename)[0]) or f"folder_{int(time.time())}"
+        
+        self.log(f"Скачивание с распаковкой: {folder_name}")
+        if download_response.status_code != 200:
+            self.log(f"Ошибка загрузки: {download_response.status_code}")
+            return False
+            
+        # Распаковываем во временную папку; остаток прерванной попытки этой ссылки удаляем
+        part_dir = self.get_part_path(save_path, folder_name, public_key)
+        shutil.rmtree(part_dir, ignore_errors=True)
+        os.makedirs(part_dir)
+        extractor = ZipStreamExtractor(part_dir)
+        try:
+            for chunk in download_response.iter_content(chunk_size=65536):
+                if not self.is_downloading:
+                    extractor.abort()
+                    download_response.close()
+                    shutil.rmtree(part_dir, ignore_errors=True)
+                    return False
+                if chunk:
+                    extractor.feed(chunk)
+                    self.report_progress(len(chunk))
+            extractor.close()
+        except (ZipStreamError, zlib.error, OSError) as e:
+            extractor.abort()
+            download_response.close()
+            shutil.rmtree(part_dir, ignore_errors=True)
+            self.log(f"Ошибка распаковки: {str(e)}")
+            return None if self.keep_zip_on_error else False
+            
+        target_dir = self.get_unique_path(save_path, folder_name, is_dir=True)
+        if os.name == 'nt':
+            # Windows не переименовывает папку поверх существующей, даже пустой
+            os.rmdir(target_dir)
+        os.replace(part_dir, target_dir)
+        
+        self.log(f"✓ Успешно: {folder_name} (файлов: {extractor.files_extracted})")
+        return True
+        
+    def get_filename_from_url(self, url):
+        """Извлекает имя файла из URL"""
+        try:
+            decoded_url = unquote(url)
+            if 'filename=' in decoded_url:
+                filename_part = decoded_url.split('filename=')[1]
+                return filename_part.split('&')[0]
+            
+            path = decoded_url.split('?')[0]
+            filename = os.path.basename(path)
+            return filename if filename and '.' in filename else None
+        except:
+            return None
+
+class QueueWorker(DownloaderCore):
+    """Фоновый воркер: берет ссылки из общей очереди и скачивает их без интерфейса"""
+    def __init__(self, queue_path, save_path, stream_extract=False, keep_zip_on_error=True,
+                 write_buffer_mb=32, fsync_policy='none', sync_mode=False, sync_prune=False):
+        import socket
+        
+        super().__init__()
+        self.queue = JobQueue(queue_path)
+        self.save_path = save_path
+        self.stream_extract = stream_extract
+        self.keep_zip_on_error = keep_zip_on_error
+        self.write_buffer_mb = write_buffer_mb
+        self.fsync_policy = fsync_policy
+        self.sync_mode = sync_mode
+        self.sync_prune = sync_prune
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.job_id = None
+        self.bytes_done = 0
+        self.lease_lost = False
+        
+    def log(self, message):
+        self.capture_error(message)
+        # У собранного .exe без консоли stdout может отсутствовать
+        if sys.stdout:
+            print(f"[{time.strftime('%H:%M:%S')}] {self.worker_id} {message}", flush=True)
+            
+    def report_progress(self, nbytes):
+        self.bytes_done += nbytes
+        
+    def heartbeat_loop(self):
+        """Продлевает аренду текущего задания, пока воркер жив"""
+        import sqlite3
+        
+        while self.job_id is not None or self.is_downloading:
+            job_id = self.job_id
+            delay = JobQueue.LEASE_SECONDS / 3
+            try:
+                if job_id is not None and not self.queue.heartbeat(job_id, self.worker_id, self.bytes_done):
+                    # Аренду забрали (воркер слишком долго молчал) - прерываем задание
+                    self.log(f"Аренда задания {job_id} потеряна")
+                    self.lease_lost = True
+                    self.is_downloading = False
+            except sqlite3.Error as e:
+                # База занята или сетевой диск недоступен - повторяем чаще, пока аренда не истекла
+                self.log(f"Не удалось продлить аренду задания {job_id}: {e}")
+                delay = JobQueue.LEASE_SECONDS / 12
+            time.sleep(delay)
+            
+    def queue_call(self, method, *args, attempts=3):
+        """Вызывает метод очереди, повторяя попытку, если база занята или недоступна"""
+        import sqlite3
+        
+        for attempt in range(attempts):
+            try:
+                return method(*args)
+            except sqlite3.Error as e:
+                if attempt == attempts - 1:
+                    raise
+                self.log(f"Ошибка очереди заданий: {e}, повтор")
+                time.sleep(JobQueue.LEASE_SECONDS / 12)
+                
+    def run(self):
+        """Обрабатывает задания, пока очередь не опустеет"""
+        import sqlite3
+        
+        self.is_downloading = True
+        heartbeat = threading.Thread(target=self.heartbeat_loop, daemon=True)
+        heartbeat.start()
+        try:
+            while True:
+                job = self.queue_call(self.queue.lease, self.worker_id)
+                if job is None:
+                    break
+                self.job_id, link = job
+                self.bytes_done = 0
+                self.last_error = None
+                self.lease_lost = False
+                self.log(f"Обработка: {link}")
+                try:
+                    ok = self.process_link(link, self.save_path)
+                except Exception as e:
+                    ok = False
+                    self.log(f"✗ Ошибка: {str(e)}")
+                if self.lease_lost:
+                    # Задание уже выполняет другой воркер
+                    self.is_downloading = True
+                else:
+                    try:
+                        self.queue_call(self.queue.heartbeat, self.job_id, self.worker_id, self.bytes_done)
+                        self.queue_call(self.queue.finish, self.job_id, self.worker_id, ok,
+                                        None if ok else self.last_error)
+                    except sqlite3.Error as e:
+                        # Аренда истечет, и задание выполнит другой воркер
+                        self.log(f"Не удалось сохранить результат задания {self.job_id}: {e}")
+                self.job_id = None
+        finally:
+            self.job_id = None
+            self.is_downloading = False
+            self.sync_writer()
+
+
+class YandexDiskDownloader(DownloaderCore):
     def __init__(self, root):
+        super().__init__()
         self.root = root
         self.root.title("Yandex.Disk Mass Downloader v2.0")
         self.root.geometry("900x750")
@@ -91,23 +1633,36 @@ class YandexDiskDownloader:
         
         self.default_download_dir = self.get_default_download_dir()
         
+        self.status_text = "Готов к работе"
+        self.last_status_update = 0
+        self.jobs = JobModel()
+        self.current_job = None
+        
         self.create_widgets()
-        self.is_downloading = False
         
-        # Настройка Drag&Drop
-        self.setup_drag_drop()
+        # Некритичная настройка выполняется после первой отрисовки окна
+        self.root.after_idle(self.finish_startup)
+        
+    def finish_startup(self):
+        """Отложенная настройка: меню, горячие клавиши, мониторинг и Drag&Drop"""
+        # Создаем контекстное меню
+        self.create_context_menus()
+        
+        # Отслеживаем ввод текста для автоматического скрытия подсказки
+        self.setup_text_monitoring()
         
         # Настройка горячих клавиш
         self.setup_hotkeys()
         
+        # Обновление таблицы заданий
+        self.refresh_jobs()
+        
+        # Настройка Drag&Drop (импорт tkinterdnd2 - самая медленная часть запуска)
+        self.setup_drag_drop()
+        
     def get_default_download_dir(self):
         """Получает путь к папке загрузок рядом с исполняемым файлом"""
-        if getattr(sys, 'frozen', False):
-            base_dir = os.path.dirname(sys.executable)
-        else:
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-        
-        download_dir = os.path.join(base_dir, "Yandex_Downloads")
+        download_dir = os.path.join(self.get_base_dir(), "Yandex_Downloads")
         if not os.path.exists(download_dir):
             os.makedirs(download_dir)
         return download_dir
@@ -231,6 +1786,70 @@ class YandexDiskDownloader:
                      bg=self.secondary_color, fg='white',
                      font=('Arial', 9), radius=6, padx=12, pady=4).pack(side=tk.RIGHT, padx=(5,0))
         
+        # Опции обработки архивов папок
+        options_frame = tk.Frame(settings_card.inner_frame, bg=self.card_bg)
+        options_frame.pack(fill=tk.X)
+        
+        self.extract_zip_var = tk.BooleanVar(value=False)
+        self.keep_zip_var = tk.BooleanVar(value=True)
+        
+        tk.Checkbutton(options_frame, text="Распаковывать папки на лету",
+                       variable=self.extract_zip_var,
+                       bg=self.card_bg, fg=self.text_color, activebackground=self.card_bg,
+                       font=('Arial', 9)).pack(side=tk.LEFT)
+        
+        tk.Checkbutton(options_frame, text="Сохранять архив при ошибке распаковки",
+                       variable=self.keep_zip_var,
+                       bg=self.card_bg, fg=self.text_color, activebackground=self.card_bg,
+                       font=('Arial', 9)).pack(side=tk.LEFT, padx=(10,0))
+        
+        # Количество процессов: больше одного - работа через общую очередь
+        self.workers_var = tk.IntVar(value=1)
+        tk.Spinbox(options_frame, from_=1, to=16, width=3, textvariable=self.workers_var,
+                   font=('Arial', 9)).pack(side=tk.RIGHT)
+        tk.Label(options_frame, text="Процессов:", bg=self.card_bg, fg=self.text_color,
+                 font=('Arial', 9)).pack(side=tk.RIGHT, padx=(10,5))
+        
+        # Синхронизация папок
+        sync_frame = tk.Frame(settings_card.inner_frame, bg=self.card_bg)
+        sync_frame.pack(fill=tk.X, pady=(5,0))
+        
+        self.sync_var = tk.BooleanVar(value=False)
+        self.prune_var = tk.BooleanVar(value=False)
+        
+        tk.Checkbutton(sync_frame, text="Синхронизировать папки (только новые и измененные файлы)",
+                       variable=self.sync_var,
+                       bg=self.card_bg, fg=self.text_color, activebackground=self.card_bg,
+                       font=('Arial', 9)).pack(side=tk.LEFT)
+        
+        tk.Checkbutton(sync_frame, text="Удалять файлы, удаленные на Диске",
+                       variable=self.prune_var,
+                       bg=self.card_bg, fg=self.text_color, activebackground=self.card_bg,
+                       font=('Arial', 9)).pack(side=tk.LEFT, padx=(10,0))
+        
+        # Параметры записи на диск
+        writer_frame = tk.Frame(settings_card.inner_frame, bg=self.card_bg)
+        writer_frame.pack(fill=tk.X, pady=(5,0))
+        
+        tk.Label(writer_frame, text="Буфер записи (МБ):", bg=self.card_bg, fg=self.text_color,
+                 font=('Arial', 9)).pack(side=tk.LEFT, padx=(0,5))
+        self.write_buffer_var = tk.IntVar(value=32)
+        tk.Spinbox(writer_frame, from_=4, to=1024, increment=4, width=5,
+                   textvariable=self.write_buffer_var, font=('Arial', 9)).pack(side=tk.LEFT)
+        
+        tk.Label(writer_frame, text="Сброс на диск (fsync):", bg=self.card_bg, fg=self.text_color,
+                 font=('Arial', 9)).pack(side=tk.LEFT, padx=(15,5))
+        self.fsync_labels = {
+            'none': "не выполнять",
+            'deferred': "в конце загрузки",
+            'batch': "пакетами по 64 МБ",
+            'close': "после каждого файла",
+        }
+        self.fsync_var = tk.StringVar(value=self.fsync_labels['none'])
+        ttk.Combobox(writer_frame, textvariable=self.fsync_var, state='readonly', width=20,
+                     values=list(self.fsync_labels.values()),
+                     font=('Arial', 9)).pack(side=tk.LEFT)
+        
         # Статистика и прогресс
         self.stats_label = tk.Label(settings_card.inner_frame, text="Готов к работе", 
                                    bg=self.card_bg, fg=self.text_color,
@@ -261,17 +1880,31 @@ class YandexDiskDownloader:
                                          radius=10, padx=20, pady=8)
         self.download_btn.pack(side=tk.LEFT, padx=(0,10))
         
+        RoundedButton(control_frame, text="Проверить ссылки", command=self.start_preflight,
+                     bg=self.secondary_color, fg='white',
+                     font=('Arial', 9), radius=8).pack(side=tk.LEFT, padx=(0,10))
+        
         RoundedButton(control_frame, text="Очистить всё", command=self.clear_all,
                      bg='#8e8e93', fg='white',
                      font=('Arial', 9), radius=8).pack(side=tk.LEFT)
         
+        self.preflight_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(control_frame, text="Проверять ссылки перед загрузкой",
+                       variable=self.preflight_var,
+                       bg=self.card_bg, fg=self.text_color, activebackground=self.card_bg,
+                       font=('Arial', 9)).pack(side=tk.RIGHT)
+        
         # Карточка лога с скругленными углами
         log_card = self.create_rounded_card(main_frame, "Лог выполнения")
         log_card.pack(fill=tk.BOTH, expand=True)
         
+        # Вкладки: лог и таблица заданий
+        notebook = ttk.Notebook(log_card.inner_frame)
+        notebook.pack(fill=tk.BOTH, expand=True)
+        
         # Лог в скругленном контейнере
-        log_container = tk.Frame(log_card.inner_frame, bg=self.card_bg)
-        log_container.pack(fill=tk.BOTH, expand=True)
+        log_container = tk.Frame(notebook, bg=self.card_bg)
+        notebook.add(log_container, text="Лог")
         
         log_border = tk.Frame(log_container, bg='#d1d1d6', relief='flat', bd=1)
         log_border.pack(fill=tk.BOTH, expand=True, padx=0, pady=0)
@@ -291,14 +1924,55 @@ class YandexDiskDownloader:
         )
         self.log_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
+        jobs_container = tk.Frame(notebook, bg=self.card_bg)
+        notebook.add(jobs_container, text="Задания")
+        self.create_jobs_tab(jobs_container)
+        
         # Показываем подсказку о Drag&Drop при запуске
         self.show_drop_hint()
         
-        # Создаем контекстное меню
-        self.create_context_menus()
+    def create_jobs_tab(self, parent):
+        """Создает вкладку с таблицей заданий, фильтрами и повтором ошибок"""
+        toolbar = tk.Frame(parent, bg=self.card_bg)
+        toolbar.pack(fill=tk.X, pady=(5, 5))
+        
+        tk.Label(toolbar, text="Показать:", bg=self.card_bg, fg=self.text_color,
+                 font=('Arial', 9)).pack(side=tk.LEFT, padx=(0,5))
+        self.job_filters = {"все": None}
+        self.job_filters.update((name, state) for state, name in enumerate(JobModel.STATE_NAMES))
+        self.job_filter_var = tk.StringVar(value="все")
+        filter_box = ttk.Combobox(toolbar, textvariable=self.job_filter_var, state='readonly', width=10,
+                                  values=list(self.job_filters), font=('Arial', 9))
+        filter_box.pack(side=tk.LEFT)
+        filter_box.bind('<<ComboboxSelected>>', lambda e: self.apply_job_filter())
+        
+        tk.Label(toolbar, text="Поиск:", bg=self.card_bg, fg=self.text_color,
+                 font=('Arial', 9)).pack(side=tk.LEFT, padx=(10,5))
+        self.job_search_var = tk.StringVar()
+        search_entry = tk.Entry(toolbar, textvariable=self.job_search_var, width=25,
+                                bg='white', fg=self.text_color, font=('Arial', 9))
+        search_entry.pack(side=tk.LEFT)
+        search_entry.bind('<Return>', lambda e: self.apply_job_filter())
+        
+        RoundedButton(toolbar, text="Повторить ошибки", command=self.requeue_failed,
+                     bg=self.secondary_color, fg='white',
+                     font=('Arial', 9), radius=6, padx=10, pady=2).pack(side=tk.RIGHT)
+        RoundedButton(toolbar, text="Повторить выделенные", command=self.requeue_selected,
+                     bg=self.secondary_color, fg='white',
+                     font=('Arial', 9), radius=6, padx=10, pady=2).pack(side=tk.RIGHT, padx=(0,5))
         
-        # Отслеживаем ввод текста для автоматического скрытия подсказки
-        self.setup_text_monitoring()
+        self.job_table = JobTable(parent, self.jobs, bg=self.card_bg)
+        self.job_table.pack(fill=tk.BOTH, expand=True)
+        
+    def apply_job_filter(self):
+        """Применяет фильтр по статусу и поиск по ссылке"""
+        self.job_table.set_filter(self.job_filters.get(self.job_filter_var.get()),
+                                  self.job_search_var.get().strip())
+        
+    def refresh_jobs(self):
+        """Периодически перерисовывает видимые строки таблицы заданий"""
+        self.job_table.refresh()
+        self.root.after(500, self.refresh_jobs)
         
     def setup_text_monitoring(self):
         """Настройка отслеживания ввода текста для автоматического скрытия подсказки"""
@@ -336,7 +2010,8 @@ class YandexDiskDownloader:
         
     def setup_drag_drop(self):
         """Настройка Drag&Drop функциональности"""
-        if DND_AVAILABLE:
+        DND_FILES = load_dnd(self.root)
+        if DND_FILES:
             try:
                 # Регистрируем область как цель для перетаскивания
                 self.links_text.drop_target_register(DND_FILES)
@@ -624,11 +2299,14 @@ class YandexDiskDownloader:
     def clear_all(self):
         self.links_text.delete(1.0, tk.END)
         self.log_text.delete(1.0, tk.END)
+        if not self.is_downloading:
+            self.jobs.clear()
         self.progress['value'] = 0
         self.stats_label.config(text="Готов к работе")
         self.show_drop_hint()
             
     def log(self, message):
+        self.capture_error(message)
         timestamp = time.strftime("%H:%M:%S")
         self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
         self.log_text.see(tk.END)
@@ -718,15 +2396,275 @@ class YandexDiskDownloader:
         if not os.path.exists(save_path):
             os.makedirs(save_path)
             
+        self.jobs.clear()
+        self.run_jobs(self.jobs.add(links), save_path)
+        
+    def requeue_failed(self):
+        """Повторно запускает все задания с ошибкой"""
+        self.requeue_jobs(self.jobs.indexes_in_state(JobModel.FAILED))
+        
+    def requeue_selected(self):
+        """Повторно запускает выделенные в таблице задания"""
+        self.requeue_jobs(self.job_table.selected_indexes())
+        
+    def requeue_jobs(self, indexes):
+        """Возвращает задания в очередь и запускает их без повторной вставки ссылок"""
+        if self.is_downloading:
+            messagebox.showwarning("Загрузка идет", "Дождитесь окончания текущей загрузки")
+            return
+        if not indexes:
+            self.log("Нет заданий для повтора")
+            return
+        save_path = self.folder_path.get()
+        if not save_path:
+            messagebox.showerror("Ошибка", "Выберите папку для сохранения")
+            return
+        if not os.path.exists(save_path):
+            os.makedirs(save_path)
+        self.jobs.requeue(indexes)
+        self.log(f"Повтор {len(indexes)} заданий")
+        self.run_jobs(indexes, save_path)
+        
+    def run_jobs(self, indexes, save_path):
+        """Запускает загрузку заданий из таблицы в одном или нескольких процессах"""
+        # Опции читаем в основном потоке, поток загрузки работает с копией
+        self.stream_extract = self.extract_zip_var.get()
+        self.keep_zip_on_error = self.keep_zip_var.get()
+        self.sync_mode = self.sync_var.get()
+        self.sync_prune = self.prune_var.get()
+        self.read_writer_settings()
+        
         self.is_downloading = True
         self.download_btn.button.config(state='disabled')
         
-        thread = threading.Thread(target=self.download_files, args=(links, save_path))
+        try:
+            workers = max(1, int(self.workers_var.get()))
+        except (tk.TclError, ValueError):
+            workers = 1
+        preflight = self.preflight_var.get()
+        
+        thread = threading.Thread(target=self.run_jobs_thread, args=(indexes, save_path, workers, preflight))
         thread.daemon = True
         thread.start()
         
-    def download_files(self, links, save_path):
-        total_files = len(links)
+    def run_jobs_thread(self, indexes, save_path, workers, preflight):
+        """Поток запуска: предварительная проверка, затем загрузка"""
+        if preflight:
+            indexes = self.preflight_jobs(indexes)
+            if not indexes or not self.is_downloading:
+                self.is_downloading = False
+                self.download_btn.button.config(state='normal')
+                self.log("Нет доступных ссылок для загрузки")
+                return
+                
+        if workers > 1:
+            links = [self.jobs.links[i] for i in indexes]
+            self.root.after(0, self.start_sharded_download, links, save_path, workers)
+            return
+        self.download_files(indexes, save_path)
+        
+    def preflight_jobs(self, indexes):
+        """Проверяет задания и помечает недоступные ссылки ошибкой; возвращает оставшиеся
+        
+        Ссылки с временной ошибкой проверки остаются в ожидании с пометкой ошибки.
+        """
+        links = [self.jobs.links[i] for i in indexes]
+        results = self.run_preflight(links)
+        
+        available = []
+        for index, link in zip(indexes, links):
+            category, info = results[link]
+            if category in self.UNAVAILABLE:
+                self.jobs.update(index, state=JobModel.FAILED, error=info)
+                continue
+            if category not in ('file', 'dir'):
+                self.jobs.update(index, state=JobModel.PENDING, error=info)
+            available.append(index)
+        return available
+        
+    def run_preflight(self, links):
+        """Выполняет предварительную проверку с выводом прогресса и сводки в лог"""
+        self.log(f"Предварительная проверка {len(links)} ссылок...")
+        self.progress['maximum'] = len(links)
+        self.progress['value'] = 0
+        last_update = [0]
+        
+        def on_progress(done, total):
+            # Обновляем интерфейс не чаще пяти раз в секунду
+            now = time.monotonic()
+            if now - last_update[0] >= 0.2 or done == total:
+                last_update[0] = now
+                self.progress['value'] = done
+                self.stats_label.config(text=f"Проверка ссылок {done}/{total}")
+                
+        started = time.monotonic()
+        results = self.preflight_links(links, progress_callback=on_progress)
+        self.log(self.preflight_summary(results, time.monotonic() - started))
+        
+        problems = [(link, info) for link, (category, info) in results.items()
+                    if category not in ('file', 'dir')]
+        for link, info in problems[:20]:
+            mark = "✗" if results[link][0] in self.UNAVAILABLE else "?"
+            self.log(f"{mark} {link}: {info}")
+        if len(problems) > 20:
+            self.log(f"... и еще {len(problems) - 20} (см. вкладку «Задания»)")
+        return results
+        
+    def start_preflight(self):
+        """Проверяет ссылки из поля ввода без загрузки"""
+        if self.is_downloading:
+            return
+        links = self.extract_urls_from_text(self.links_text.get(1.0, tk.END).strip())
+        if not links:
+            messagebox.showerror("Ошибка", "Не найдено валидных ссылок Яндекс.Диска")
+            return
+            
+        self.is_downloading = True
+        self.download_btn.button.config(state='disabled')
+        self.jobs.clear()
+        indexes = self.jobs.add(links)
+        
+        def check():
+            try:
+                self.preflight_jobs(indexes)
+            finally:
+                self.is_downloading = False
+                self.download_btn.button.config(state='normal')
+                self.stats_label.config(text="Проверка завершена")
+                
+        threading.Thread(target=check, daemon=True).start()
+        
+    def read_writer_settings(self):
+        """Применяет настройки буфера записи и fsync (поток записи пересоздается при изменении)"""
+        try:
+            buffer_mb = max(1, int(self.write_buffer_var.get()))
+        except (tk.TclError, ValueError):
+            buffer_mb = 32
+        policy = next((key for key, label in self.fsync_labels.items()
+                       if label == self.fsync_var.get()), 'none')
+        if (buffer_mb, policy) != (self.write_buffer_mb, self.fsync_policy):
+            self.write_buffer_mb, self.fsync_policy = buffer_mb, policy
+            if self.writer:
+                # Старый поток записи останавливаем, а не бросаем висеть
+                self.sync_writer()
+                self.writer.shutdown()
+            self.writer = None
+            
+    def report_progress(self, nbytes):
+        now = time.monotonic()
+        if self.current_job is not None:
+            self.job_bytes += nbytes
+            elapsed = now - self.job_started
+            self.jobs.update(self.current_job, size=self.job_bytes,
+                             speed=self.job_bytes / elapsed if elapsed > 0 else 0.0)
+        # Заполненность буфера записи показываем не чаще двух раз в секунду
+        if now - self.last_status_update >= 0.5:
+            self.last_status_update = now
+            self.stats_label.config(text=f"{self.status_text} | {self.writer_stats()}")
+            
+    def get_worker_command(self, queue_path, save_path):
+        """Команда запуска фонового воркера (для .exe и для скрипта)"""
+        if getattr(sys, 'frozen', False):
+            command = [sys.executable]
+        else:
+            command = [sys.executable, os.path.abspath(__file__)]
+        command += ['--worker', queue_path, '--save-path', save_path,
+                    '--write-buffer-mb', str(self.write_buffer_mb), '--fsync', self.fsync_policy]
+        if self.sync_mode:
+            command.append('--sync')
+            if self.sync_prune:
+                command.append('--prune')
+        if self.stream_extract:
+            command.append('--extract-zip')
+            if not self.keep_zip_on_error:
+                command.append('--no-keep-zip')
+        return command
+        
+    def start_sharded_download(self, links, save_path, workers):
+        """Раскладывает ссылки в общую очередь и запускает несколько процессов-воркеров"""
+        import sqlite3
+        import subprocess
+        
+        queue_path = os.path.join(save_path, ".yandex_queue.sqlite3")
+        try:
+            self.job_queue = JobQueue(queue_path)
+            self.job_queue.clear()
+            self.job_queue.add_links(links)
+        except sqlite3.Error as e:
+            self.log(f"Ошибка создания очереди: {str(e)}")
+            self.is_downloading = False
+            self.download_btn.button.config(state='normal')
+            return
+            
+        command = self.get_worker_command(queue_path, save_path)
+        self.log(f"Начало загрузки {len(links)} файлов в {workers} процессах...")
+        self.log(f"Очередь заданий: {queue_path}")
+        self.log("Подключить другую машину: " + subprocess.list2cmdline(command))
+        
+        creationflags = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+        self.worker_processes = [
+            subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                             creationflags=creationflags)
+            for _ in range(workers)
+        ]
+        self.progress['maximum'] = len(links)
+        self.progress['value'] = 0
+        self.queue_reported = set()
+        self.queue_last_finished = 0
+        self.root.after(500, self.poll_job_queue)
+        
+    def poll_job_queue(self):
+        """Обновляет общий прогресс по очереди и ждет завершения воркеров"""
+        import sqlite3
+        
+        try:
+            stats = self.job_queue.progress()
+            for job_id, link, state, error, finished in self.job_queue.finished_since(self.queue_last_finished):
+                if job_id in self.queue_reported:
+                    continue
+                self.queue_reported.add(job_id)
+                # Небольшой запас по времени: часы разных процессов и машин могут расходиться
+                self.queue_last_finished = max(self.queue_last_finished, finished - 5)
+                index = self.jobs.index_by_link.get(link)
+                if state == 'done':
+                    self.log(f"✓ Успешно: {link}")
+                    if index is not None:
+                        self.jobs.update(index, state=JobModel.DONE)
+                else:
+                    self.log(f"✗ {link}: {error or 'ошибка'}")
+                    if index is not None:
+                        self.jobs.update(index, state=JobModel.FAILED, error=error or 'ошибка')
+            for link, bytes_done, attempts in self.job_queue.active():
+                index = self.jobs.index_by_link.get(link)
+                if index is not None:
+                    self.jobs.update(index, state=JobModel.ACTIVE, size=bytes_done,
+                                     retries=max(self.jobs.retries[index], attempts - 1))
+        except sqlite3.Error as e:
+            self.log(f"Ошибка чтения очереди: {str(e)}")
+            self.root.after(1000, self.poll_job_queue)
+            return
+            
+        finished = stats['done'] + stats['failed']
+        self.progress['value'] = finished
+        self.stats_label.config(
+            text=f"Обработано {finished}/{stats['total']} | В работе: {stats['leased']} | "
+                 f"Воркеров: {stats['workers']} | {stats['bytes'] / 1024 / 1024:.1f} МБ")
+        
+        # Ждем, пока живы локальные воркеры или задания в аренде (в том числе у других машин)
+        alive = any(process.poll() is None for process in self.worker_processes)
+        if alive or stats['leased']:
+            self.root.after(500, self.poll_job_queue)
+            return
+            
+        self.is_downloading = False
+        self.download_btn.button.config(state='normal')
+        self.stats_label.config(text=f"Завершено! Успешно: {stats['done']}, Ошибок: {stats['failed']}")
+        self.log(f"=== Загрузка завершена! Успешно: {stats['done']}, Ошибок: {stats['failed']} ===")
+        if stats['pending']:
+            self.log(f"Не обработано: {stats['pending']}")
+        
+    def download_files(self, indexes, save_path):
+        total_files = len(indexes)
         successful = 0
         failed = 0
         
@@ -736,18 +2674,29 @@ class YandexDiskDownloader:
         self.log(f"Начало загрузки {total_files} файлов...")
         self.log(f"Папка сохранения: {save_path}")
         
-        for i, link in enumerate(links):
+        for i, index in enumerate(indexes):
             if not self.is_downloading:
                 break
                 
+            link = self.jobs.links[index]
+            self.current_job = index
+            self.job_started = time.monotonic()
+            self.job_bytes = 0
+            self.last_error = None
+            self.jobs.update(index, state=JobModel.ACTIVE, size=0, speed=0.0)
             try:
-                self.stats_label.config(text=f"Обработка {i+1}/{total_files}")
+                self.status_text = f"Обработка {i+1}/{total_files}"
+                self.stats_label.config(text=self.status_text)
                 self.log(f"[{i+1}/{total_files}] Обработка: {link}")
                 
-                if self.download_file_correct(link, save_path):
+                if self.process_link(link, save_path):
                     successful += 1
-                else:
+                    self.jobs.update(index, state=JobModel.DONE)
+                elif self.is_downloading:
                     failed += 1
+                    self.jobs.update(index, state=JobModel.FAILED, error=self.last_error or "ошибка")
+                else:
+                    self.jobs.update(index, state=JobModel.PENDING)
                     
                 self.progress['value'] = i + 1
                 time.sleep(0.5)
@@ -755,83 +2704,85 @@ class YandexDiskDownloader:
             except Exception as e:
                 failed += 1
                 self.log(f"✗ Ошибка: {str(e)}")
+                self.jobs.update(index, state=JobModel.FAILED, error=str(e))
                 
+        self.current_job = None
         self.is_downloading = False
         self.download_btn.button.config(state='normal')
         self.stats_label.config(text=f"Завершено! Успешно: {successful}, Ошибок: {failed}")
         self.log(f"=== Загрузка завершена! Успешно: {successful}, Ошибок: {failed} ===")
+        if self.writer:
+            self.sync_writer()
+            self.log(f"Запись на диск: {self.writer_stats()}")
+        if self.cache:
+            self.log(f"Кэш API (попаданий/запросов): {self.cache.stats()}")
         
         if successful > 0:
             messagebox.showinfo("Готово", f"Загрузка завершена!\nУспешно: {successful}\nОшибок: {failed}")
+
+def benchmark_startup():
+    """Замер холодного старта: время импорта модуля и время до первого окна"""
+    started = time.perf_counter()
+    root = tk.Tk()
+    app = YandexDiskDownloader(root)
+    timings = {}
     
-    def download_file_correct(self, public_key, save_path):
-        """Скачивает файл используя API Яндекс.Диска"""
-        try:
-            base_url = 'https://cloud-api.yandex.net/v1/disk/public/resources/download?'
-            final_url = base_url + urlencode(dict(public_key=public_key))
-            response = requests.get(final_url, timeout=30)
-            
-            if response.status_code != 200:
-                self.log(f"Ошибка получения ссылки: {response.status_code}")
-                return False
-                
-            download_url = response.json()['href']
-            filename = self.get_filename_from_url(download_url) or f"file_{int(time.time())}.downloaded"
-            safe_filename = sanitize_filename(filename)
-            full_path = os.path.join(save_path, safe_filename)
-            
-            # Если файл уже существует, добавляем номер
-            counter = 1
-            original_path = full_path
-            while os.path.exists(full_path):
-                name, ext = os.path.splitext(safe_filename)
-                full_path = os.path.join(save_path, f"{name}_{counter}{ext}")
-                counter += 1
-            
-            self.log(f"Скачивание: {safe_filename}")
-            download_response = requests.get(download_url, stream=True, timeout=60)
-            
-            if download_response.status_code == 200:
-                with open(full_path, 'wb') as f:
-                    for chunk in download_response.iter_content(chunk_size=8192):
-                        if not self.is_downloading:
-                            f.close()
-                            if os.path.exists(full_path):
-                                os.remove(full_path)
-                            return False
-                        if chunk:
-                            f.write(chunk)
-                
-                self.log(f"✓ Успешно: {safe_filename}")
-                return True
-            else:
-                self.log(f"Ошибка загрузки: {download_response.status_code}")
-                return False
-                
-        except Exception as e:
-            self.log(f"Ошибка скачивания: {str(e)}")
-            return False
+    def on_map(event):
+        if event.widget is root and 'window' not in timings:
+            timings['window'] = time.perf_counter() - started
+            # Даем отработать отложенной настройке и закрываем окно
+            root.after_idle(lambda: (timings.setdefault('ready', time.perf_counter() - started),
+                                     root.destroy()))
     
-    def get_filename_from_url(self, url):
-        """Извлекает имя файла из URL"""
-        try:
-            decoded_url = unquote(url)
-            if 'filename=' in decoded_url:
-                filename_part = decoded_url.split('filename=')[1]
-                return filename_part.split('&')[0]
-            
-            path = decoded_url.split('?')[0]
-            filename = os.path.basename(path)
-            return filename if filename and '.' in filename else None
-        except:
-            return None
+    root.bind('<Map>', on_map)
+    root.mainloop()
+    
+    print(f"Импорт модуля: {(_IMPORT_FINISHED - _IMPORT_STARTED) * 1000:.1f} мс")
+    print(f"До первого окна: {timings.get('window', 0) * 1000:.1f} мс")
+    print(f"До полной готовности: {timings.get('ready', 0) * 1000:.1f} мс")
+    print(f"Загружены тяжелые модули: "
+          f"{', '.join(m for m in ('requests', 'pathvalidate', 'tkinterdnd2') if m in sys.modules) or 'нет'}")
+
+def parse_args(argv):
+    """Разбирает аргументы командной строки (только если они переданы)"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Yandex.Disk Mass Downloader")
+    parser.add_argument('--benchmark-startup', action='store_true',
+                        help="замерить время запуска и выйти")
+    parser.add_argument('--worker', metavar='QUEUE',
+                        help="запустить фоновый воркер для общей очереди заданий")
+    parser.add_argument('--save-path', help="папка для сохранения (для воркера)")
+    parser.add_argument('--extract-zip', action='store_true',
+                        help="распаковывать архивы папок на лету")
+    parser.add_argument('--no-keep-zip', action='store_true',
+                        help="не сохранять архив при ошибке распаковки")
+    parser.add_argument('--write-buffer-mb', type=int, default=32,
+                        help="объем буфера записи на диск в МБ")
+    parser.add_argument('--fsync', choices=DiskWriter.FSYNC_POLICIES, default='none',
+                        help="когда сбрасывать данные на диск")
+    parser.add_argument('--sync', action='store_true',
+                        help="синхронизировать папки: скачивать только новые и измененные файлы")
+    parser.add_argument('--prune', action='store_true',
+                        help="при синхронизации удалять файлы, удаленные на Диске")
+    return parser.parse_args(argv)
 
 def main():
-    # Создаем корневое окно с поддержкой Drag&Drop если доступно
-    if DND_AVAILABLE:
-        root = TkinterDnD.Tk()
-    else:
-        root = tk.Tk()
+    # Без аргументов argparse не загружаем, чтобы не замедлять запуск окна
+    args = parse_args(sys.argv[1:]) if sys.argv[1:] else None
+    
+    if args and args.benchmark_startup:
+        benchmark_startup()
+        return
+        
+    if args and args.worker:
+        save_path = args.save_path or os.path.dirname(os.path.abspath(args.worker))
+        QueueWorker(args.worker, save_path, args.extract_zip, not args.no_keep_zip,
+                    args.write_buffer_mb, args.fsync, args.sync, args.prune).run()
+        return
+    
+    # Окно создается обычным tk.Tk, Drag&Drop подключается после первой отрисовки
+    root = tk.Tk()
     
     app = YandexDiskDownloader(root)
     root.mainloop()